@@ -1,12 +1,12 @@
 # ==============================================================================
 #                 Discord Book Finder Bot using discord.py v2.0+
 # ==============================================================================
-# This version includes a Flask web server for compatibility with hosting
+# This version includes an aiohttp healthcheck server for compatibility with hosting
 # services and uses the latest recommended methods for all libraries.
 # ==============================================================================
 #
-# REQUIRED LIBRARIES: discord.py, python-dotenv, requests, beautifulsoup4, arxiv, Flask
-# INSTALL THEM WITH: pip install discord.py python-dotenv requests beautifulsoup4 arxiv Flask
+# REQUIRED LIBRARIES: discord.py, python-dotenv, aiohttp, lxml, arxiv
+# INSTALL THEM WITH: pip install discord.py python-dotenv aiohttp lxml arxiv
 #
 # ==============================================================================
 
@@ -16,157 +16,419 @@ from discord.ui import Button, View, Select
 import os
 from dotenv import load_dotenv
 import asyncio
-
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlencode
-import arxiv
-
-from flask import Flask
-from threading import Thread
+import functools
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
+import hashlib
+import json
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+
+import aiohttp
+from aiohttp import web
+from lxml import etree
+from urllib.parse import urljoin, urlencode, urlsplit
+from html import unescape
+
+from libgen_parser import LIBGEN_BASE_URL, parse_books, results_table_slice
+
+# --- LOGGING ---
+logger = logging.getLogger("bookfinder")
+
+def configure_logging():
+    """Routes log records through a queue to a listener thread so a slow stdout never blocks the event loop."""
+    # Called from __main__ only: spawned parse workers re-import this module and must not start listener threads.
+    # The handlers guard keeps a second call from attaching duplicate handlers.
+    if logger.handlers: return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
 # --- ASYNCHRONOUS UTILITY AND SCRAPER FUNCTIONS ---
 
-def _blocking_get_download_link(mirror_url):
-    """Synchronous part of get_download_link to be run in a thread."""
-    if mirror_url == "N/A": return None
+class ResultCache:
+    """Small LRU cache for scraped results; entries expire `ttl` seconds after being stored."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl, self._entries = maxsize, ttl, OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        expiry_ts, value = entry
+        if time.monotonic() > expiry_ts:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (expiry_ts, _) in self._entries.items() if now > expiry_ts]: del self._entries[key]
+
+_search_cache = ResultCache(maxsize=512, ttl=600)
+_link_cache = ResultCache(maxsize=2048, ttl=1800)
+_arxiv_cache = ResultCache(maxsize=256, ttl=900)
+
+async def cache_reaper(interval=60):
+    """Drops expired cache entries in the background so idle results don't linger in memory."""
+    while True:
+        await asyncio.sleep(interval)
+        for cache in (_search_cache, _link_cache, _arxiv_cache): cache.purge_expired()
+
+_inflight = {}
+
+async def _coalesced(key, factory):
+    """Runs factory() once per key at a time; concurrent callers for the same key share its result."""
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(factory())
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so one caller giving up doesn't cancel the fetch for everyone else waiting on it.
+    return await asyncio.shield(task)
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'}
+
+# Caps on in-flight scrapes so a user spamming buttons can't exhaust sockets or bandwidth.
+# Built by create_fetch_semaphores() from setup_hook: before Python 3.10 a Semaphore binds to the loop
+# current at construction, and at import time that isn't the loop client.run() goes on to create.
+SEARCH_SEM = MIRROR_SEM = None
+
+def create_fetch_semaphores():
+    """Creates SEARCH_SEM and MIRROR_SEM on the running loop; must be called from inside it."""
+    global SEARCH_SEM, MIRROR_SEM
+    SEARCH_SEM = asyncio.Semaphore(int(os.getenv('MAX_CONCURRENT_SEARCHES', 16)))
+    MIRROR_SEM = asyncio.Semaphore(int(os.getenv('MAX_CONCURRENT_MIRROR_FETCHES', 8)))
+
+# Large result pages are parsed in worker processes so concurrent searches aren't serialized by the GIL.
+# Below the threshold, pickling the page across processes costs more than the parse saves.
+PARSE_POOL = None
+PROCESS_PARSE_THRESHOLD = 32 * 1024
+
+def start_parse_pool():
+    """(Re)creates PARSE_POOL, shutting down any previous pool; called from setup_hook and after a worker dies."""
+    global PARSE_POOL
+    if PARSE_POOL: PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+    # spawn, not fork: by now this process runs the log listener, executor threads and the gateway, and a
+    # forked child can inherit a lock one of those threads held and deadlock. A spawned worker re-imports this
+    # script as __mp_main__ (discord, aiohttp and all), so each is a full-size interpreter: keep the pool small,
+    # since os.cpu_count() in a container often reports the host's cores.
+    workers = int(os.getenv('PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+    PARSE_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+class HostRateLimiter:
+    """Token bucket per host, so bursts of searches and mirror lookups don't trip libgen's 429/503 throttling."""
+    def __init__(self, rate, burst):
+        # acquire() divides by the rate, and a non-positive rate would never refill the bucket anyway.
+        if rate <= 0: raise ValueError(f"REQUESTS_PER_HOST_PER_SECOND must be positive, got {rate}")
+        self.rate, self.burst, self._buckets = rate, burst, {}
+
+    async def acquire(self, url):
+        host = urlsplit(url).netloc
+        while True:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[host] = (tokens - 1, now)
+                return
+            self._buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+# Built by create_rate_limiter() from setup_hook, after __main__'s load_dotenv(), so a rate set in .env applies.
+RATE_LIMITER = None
+
+def create_rate_limiter():
+    """Creates RATE_LIMITER from REQUESTS_PER_HOST_PER_SECOND; raises ValueError for a rate that isn't positive."""
+    global RATE_LIMITER
+    RATE_LIMITER = HostRateLimiter(rate=float(os.getenv('REQUESTS_PER_HOST_PER_SECOND', 5)), burst=10)
+
+async def _fetch(session, url, semaphore):
+    """Downloads a page body on the shared aiohttp session."""
+    await RATE_LIMITER.acquire(url)
+    async with semaphore, session.get(url) as response:
+        response.raise_for_status()
+        return await response.read()
+
+# Cheap byte-level match for the usual well-formed GET anchor; the pull parser only handles pages it misses.
+# The lookahead requires the closing delimiter: chunks end wherever the network split the data, and an href cut off
+# at the end of one would otherwise match as a truncated link.
+_GET_HREF_RE = re.compile(rb'href=["\']?([^"\'\s>]*get\.php\?md5=[^"\'\s>]*)(?=["\'\s>])', re.I)
+
+def _first_download_link(parser, mirror_url):
+    """Returns the first get.php link among the anchors the pull parser has finished so far."""
+    for _, anchor in parser.read_events():
+        href = anchor.get('href', '')
+        if 'get.php?md5=' in href: return urljoin(mirror_url, href)
+    return None
+
+# Unread body left past an early exit makes aiohttp close the socket instead of pooling it. Mirror pages are a few
+# KB, so reading the rest is cheaper than a new TLS handshake on the next lookup; past this, dropping the socket wins.
+MIRROR_DRAIN_LIMIT = 64 * 1024
+
+async def _drain(response, limit=MIRROR_DRAIN_LIMIT):
+    """Reads up to `limit` more bytes of a response so its connection can return to the pool."""
+    if (response.content_length or 0) > limit: return
+    while limit > 0:
+        chunk = await response.content.read(limit)
+        if not chunk: return
+        limit -= len(chunk)
+
+async def _fetch_download_link(session, mirror_url):
+    """Streams a mirror page through an incremental parser and stops parsing at the first get.php link."""
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'}
-        mirror_response = requests.get(mirror_url, headers=headers, timeout=20)
-        mirror_response.raise_for_status()
-        mirror_soup = BeautifulSoup(mirror_response.content, 'html.parser')
-        link_tag = mirror_soup.find('a', href=lambda href: href and 'get.php?md5=' in href)
-        if link_tag: return urljoin(mirror_url, link_tag['href'])
-        return None
+        await RATE_LIMITER.acquire(mirror_url)
+        async with MIRROR_SEM, session.get(mirror_url) as response:
+            response.raise_for_status()
+            # libgen mirrors serve UTF-8; naming it up front skips libxml2's encoding sniffing on the first chunk.
+            parser = etree.HTMLPullParser(events=('end',), tag='a', encoding='utf-8')
+            link, tail = None, b''
+            async for chunk in response.content.iter_chunked(16 * 1024):
+                # Carry the previous chunks' tail over so an href split across chunks is matched once it is complete.
+                buffer = tail + chunk
+                match = _GET_HREF_RE.search(buffer)
+                if match:
+                    link = urljoin(mirror_url, unescape(match.group(1).decode('utf-8', 'replace')))
+                    break
+                parser.feed(chunk)
+                link = _first_download_link(parser, mirror_url)
+                if link: break
+                tail = buffer[-512:]
+            if link:
+                await _drain(response)
+                return link
+        try: parser.close()
+        except etree.XMLSyntaxError: return None
+        return _first_download_link(parser, mirror_url)
     except Exception as e:
-        print(f"[DOWNLOADER_ERROR] An exception occurred: {e}")
+        logger.error("[DOWNLOADER_ERROR] An exception occurred: %s", e)
         return None
 
-async def get_download_link(mirror_url):
-    """Runs the blocking download link fetcher in a separate thread."""
-    return await asyncio.to_thread(_blocking_get_download_link, mirror_url)
+# Upper bound on a whole mirror race, including time spent queued behind MIRROR_SEM and the rate limiter.
+MIRROR_RACE_TIMEOUT = 30
+
+async def _race_mirrors(session, mirror_urls):
+    """Queries all mirror pages concurrently and returns the first direct link any of them yields."""
+    pending = {asyncio.create_task(_fetch_download_link(session, url)) for url in mirror_urls}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MIRROR_RACE_TIMEOUT
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning("[DOWNLOADER_ERROR] Mirror lookup timed out after %ss", MIRROR_RACE_TIMEOUT)
+                return None
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                link = task.result()
+                if link:
+                    _link_cache.put(tuple(mirror_urls), link)
+                    return link
+        return None
+    finally:
+        for task in pending: task.cancel()
+
+async def get_download_link(session, mirror_urls):
+    """Resolves a book's direct download link, reusing recent and in-flight resolutions."""
+    cache_key = tuple(mirror_urls)
+    cached = _link_cache.get(cache_key)
+    if cached is not None: return cached
+    return await _coalesced(('link', cache_key), lambda: _race_mirrors(session, mirror_urls))
 
 
-def _blocking_search_books(query, preferred_format, page):
-    """Synchronous part of search_books to be run in a thread."""
-    base_url = "https://libgen.li/index.php"
-    params = {'req': query, 'page': page, 'res': 100} 
-    search_url = f"{base_url}?{urlencode(params)}"
-    
+@functools.lru_cache(maxsize=256)
+def _search_url(query, page, res):
+    """Builds the libgen search URL; memoized because popular queries repeat across users."""
+    return f"{LIBGEN_BASE_URL}?{urlencode({'req': query, 'page': page, 'res': res})}"
+
+async def _scrape_books(session, query, preferred_format, page, res):
+    """Fetches one page of libgen results on the event loop and parses it in a worker thread or process."""
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'}
-        response = requests.get(search_url, headers=headers, timeout=20)
-        response.raise_for_status()
+        html = results_table_slice(await _fetch(session, _search_url(query, page, res), SEARCH_SEM))
     except Exception as e:
-        print(f"[SCRAPER_ERROR] Failed to fetch search results: {e}")
+        logger.error("[SCRAPER_ERROR] Failed to fetch search results: %s", e)
         return []
-        
-    soup = BeautifulSoup(response.content, 'html.parser')
-    results_table = soup.find('table', id='tablelibgen')
-    if not results_table: return []
-    
-    book_rows = results_table.find('tbody').find_all('tr')
-    books_found = []
-    
-    for row in book_rows:
-        cells = row.find_all('td')
-        if len(cells) >= 9:
-            title_text = "N/A"
-            title_b_tag = cells[0].find('b')
-            if title_b_tag: title_text = title_b_tag.get_text(' ', strip=True)
-            else:
-                title_a_tag = cells[0].find('a')
-                if title_a_tag: title_text = title_a_tag.get_text(strip=True)
-
-            mirror_links, mirror_page_url, final_link_url = cells[8].find_all('a'), "N/A", None
-            for link in mirror_links:
-                href = link.get('href', '')
-                if 'get.php' in href:
-                    final_link_url = urljoin(base_url, href)
-                    break
-            if not final_link_url and mirror_links:
-                mirror_page_url = urljoin(base_url, mirror_links[0]['href'])
-            
-            books_found.append({
-                "Title": title_text, "Author": cells[1].get_text(strip=True),
-                "Size": cells[6].get_text(strip=True), "Extension": cells[7].get_text(strip=True).lower(),
-                "Mirror_Page": mirror_page_url, "Final_Link": final_link_url,
-            })
-    
-    if preferred_format: books_found.sort(key=lambda book: book['Extension'] == preferred_format, reverse=True)
+
+    # None selects the default thread pool; run_in_executor skips to_thread's contextvars copy, which nothing here reads.
+    loop, pool = asyncio.get_running_loop(), None if len(html) < PROCESS_PARSE_THRESHOLD else PARSE_POOL
+    try:
+        books_found = await loop.run_in_executor(pool, parse_books, html, preferred_format)
+    except BrokenProcessPool:
+        # A dead worker breaks the whole pool for good; replace it (once, if several searches hit this together)
+        # and parse this page in a thread so the search still answers.
+        logger.error("[SCRAPER_ERROR] Parse pool broke; restarting it and parsing in a thread")
+        if pool is PARSE_POOL: start_parse_pool()
+        books_found = await loop.run_in_executor(None, parse_books, html, preferred_format)
+    if books_found: _search_cache.put((query, preferred_format, page, res), books_found)
     return books_found
 
-async def search_books(query, preferred_format=None, page=1):
-    """Runs the blocking book search in a separate thread."""
-    return await asyncio.to_thread(_blocking_search_books, query, preferred_format, page)
+async def search_books(session, query, preferred_format=None, page=1, res=25):
+    """Returns one page of libgen results, reusing recent and in-flight scrapes of the same page."""
+    # libgen matching ignores case and extra whitespace, so "Dune " and "dune" share one cache entry.
+    query = ' '.join(query.lower().split())
+    cache_key = (query, preferred_format, page, res)
+    cached = _search_cache.get(cache_key)
+    if cached is not None: return cached
+    return await _coalesced(('search',) + cache_key, lambda: _scrape_books(session, query, preferred_format, page, res))
 
 
 # --- DISCORD UI CLASSES ---
 
+async def _disable_expired_view(view):
+    """Greys out an expired view's controls on the message it was sent with."""
+    if view.message is None: return
+    for item in view.children: item.disabled = True
+    try: await view.message.edit(view=view)
+    except discord.HTTPException: pass
+
 class BookSearchView(View):
-    def __init__(self, query, preferred_format, author):
+    def __init__(self, query, preferred_format, author, session):
         super().__init__(timeout=300)
-        self.query, self.preferred_format, self.author = query, preferred_format, author
+        self.query, self.preferred_format, self.author, self.session = query, preferred_format, author, session
         self.current_page, self.page_size, self.books = 1, 5, []
-        self.has_more_results = True
+        self.has_more_results, self._embeds, self._options, self._prefetch, self._resolving = True, {}, {}, None, set()
+        self.message, self._prefetch_batch = None, None
+
+    def _next_batch(self):
+        """Returns (page, res) for the next libgen request: 25-row pages until 100 rows are loaded, then 100-row pages."""
+        # 25 divides 100, so after four small pages the loaded rows line up exactly with libgen's 100-row page 2.
+        # preferred_format is sorted within each scraped batch, so it always uses 100-row batches to keep that
+        # sort covering 100 rows; smaller batches would bury matches from rows 26-100 behind other formats.
+        res = 25 if len(self.books) < 100 and not self.preferred_format else 100
+        return (len(self.books) // res) + 1, res
+
+    def _prefetch_next_batch(self, end_index):
+        """Starts scraping the next libgen page in the background when the next Discord page will need it."""
+        if not self.has_more_results or len(self.books) >= end_index + self.page_size: return
+        # An unconsumed prefetch is always for the next batch, since only _load_next_batch adds rows and it takes the task.
+        if self._prefetch: return
+        # _load_next_batch awaits this task directly rather than going through the cache, which never stores empty pages.
+        self._prefetch_batch = self._next_batch()
+        page, res = self._prefetch_batch
+        self._prefetch = asyncio.create_task(search_books(self.session, self.query, self.preferred_format, page=page, res=res))
+
+    async def _load_next_batch(self):
+        """Appends the next libgen page of results; returns False once libgen has nothing more."""
+        page, res = self._next_batch()
+        prefetch, self._prefetch = self._prefetch, None
+        # A successful fetch that finds the end of the results is empty and uncached; reusing the prefetch avoids refetching it.
+        if prefetch and self._prefetch_batch == (page, res): new_books = await prefetch
+        else: new_books = await search_books(self.session, self.query, self.preferred_format, page=page, res=res)
+        if len(new_books) < res: self.has_more_results = False
+        if new_books: self._options.clear()
+        self.books.extend(new_books)
+        return bool(new_books)
+
+    async def _resolve_mirrors(self, books):
+        """Resolves the shown books' mirror pages in the background so a selection can answer instantly."""
+        pending = [book for book in books if not book.final_link and book.mirror_pages]
+        links = await asyncio.gather(*[get_download_link(self.session, book.mirror_pages) for book in pending], return_exceptions=True)
+        for book, link in zip(pending, links):
+            if isinstance(link, str): book.final_link = link
 
     async def create_embed(self):
-        embed = discord.Embed(title=f"Book Results for '{self.query}'", description=f"Showing page {self.current_page}.", color=discord.Color.blue())
+        embed = self._embeds.get(self.current_page) or discord.Embed(title=f"Book Results for '{self.query}'", description=f"Showing page {self.current_page}.", color=discord.Color.blue())
         start_index, end_index = (self.current_page - 1) * self.page_size, self.current_page * self.page_size
         
         while len(self.books) < end_index and self.has_more_results:
-            scraper_page = (len(self.books) // 100) + 1
-            new_books = await search_books(self.query, self.preferred_format, page=scraper_page)
-            if not new_books or len(new_books) < 100: self.has_more_results = False
-            if new_books: self.books.extend(new_books)
-            else: break
+            if not await self._load_next_batch(): break
             
         current_page_books = self.books[start_index:end_index]
         if not current_page_books:
             embed.description, self.select_menu.disabled, self.next_button.disabled = "No more results found.", True, True
             return embed
             
-        self.select_menu.options = [discord.SelectOption(label=f"{start_index + i + 1}. {book['Title'][:80]}", description=f"{book['Author'][:50]} [{book['Extension']}, {book['Size']}]", value=str(start_index + i)) for i, book in enumerate(current_page_books)]
+        options = self._options.get(self.current_page)
+        if options is None: options = self._options[self.current_page] = [discord.SelectOption(label=f"{start_index + i + 1}. {book.title[:80]}", description=book.summary, value=str(start_index + i)) for i, book in enumerate(current_page_books)]
+        self.select_menu.options = options
         self.next_button.disabled = len(self.books) <= end_index and not self.has_more_results
+        self._prefetch_next_batch(end_index)
+        if self.current_page not in self._embeds:
+            # First render only: failed lookups aren't cached, so re-resolving on every Prev/Next would re-race their
+            # mirrors and spend rate-limit tokens other users need. A selection still retries a failed book, and one
+            # made before this finishes joins the in-flight lookup through get_download_link's coalescing.
+            task = asyncio.create_task(self._resolve_mirrors(current_page_books))
+            self._resolving.add(task)
+            task.add_done_callback(self._resolving.discard)
+        self._embeds[self.current_page] = embed
         return embed
 
-    @discord.ui.select(placeholder="Choose a book to get its download link...")
+    async def on_timeout(self):
+        # Drop background work and scraped rows so an expired view holds nothing alive.
+        for task in (self._prefetch, *self._resolving):
+            if task: task.cancel()
+        self.books, self._embeds, self._options = [], {}, {}
+        await _disable_expired_view(self)
+
+    @discord.ui.select(placeholder="Choose a book to get its download link...", custom_id="book_select")
     async def select_menu(self, interaction: discord.Interaction, select: discord.ui.Select):
         if interaction.user != self.author: return await interaction.response.send_message("This is not your search menu!", ephemeral=True)
         await interaction.response.defer()
         
         book = self.books[int(select.values[0])]
-        final_link = book.get('Final_Link') or await get_download_link(book['Mirror_Page'])
-        safe_title = discord.utils.escape_markdown(book['Title'])
+        final_link = book.final_link or await get_download_link(self.session, book.mirror_pages)
+        safe_title = discord.utils.escape_markdown(book.title)
         
         if final_link: await interaction.followup.send(f"✅ Here is the link for **{safe_title}**:\n[{safe_title}]({final_link})")
         else: await interaction.followup.send(f"❌ Could not find a valid download link for **{safe_title}**.")
 
-    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, disabled=True)
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, disabled=True, custom_id="book_prev")
     async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user != self.author: return
+        await interaction.response.defer()
         if self.current_page > 1: self.current_page -= 1
         button.disabled = self.current_page == 1
-        await interaction.response.edit_message(embed=await self.create_embed(), view=self)
+        await interaction.edit_original_response(embed=await self.create_embed(), view=self)
 
-    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary, custom_id="book_next")
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user != self.author: return
+        await interaction.response.defer()
         self.current_page += 1
         self.prev_button.disabled = False
-        await interaction.response.edit_message(embed=await self.create_embed(), view=self)
+        await interaction.edit_original_response(embed=await self.create_embed(), view=self)
+
+# arxiv (with requests and feedparser) is imported on the first /findpapers rather than at startup.
+# The client is shared so its HTTP session and arXiv's one-request-per-3s pacing persist across searches.
+_arxiv_client, _arxiv_lock = None, threading.Lock()
+
+def _arxiv():
+    """Returns (arxiv module, shared client), importing arxiv on first use; called from worker threads."""
+    global _arxiv_client
+    with _arxiv_lock:
+        import arxiv
+        if _arxiv_client is None: _arxiv_client = arxiv.Client()
+        return arxiv, _arxiv_client
 
 class PaperSearchView(View):
     def __init__(self, query, author):
         super().__init__(timeout=300)
         self.query, self.author = query, author
         self.current_page, self.page_size, self.papers = 1, 5, []
-        self.search_done = False
+        self.search_done, self._embeds, self._options, self._author_strs = False, {}, {}, []
+        self.message = None
 
     # FIX: Use the new Client.results() method to avoid deprecation warning
     def _blocking_search_papers(self):
         """Synchronous arXiv search to be run in a thread."""
-        client = arxiv.Client()
+        arxiv, client = _arxiv()
         search = arxiv.Search(
             query=self.query,
             max_results=50
@@ -174,10 +436,20 @@ class PaperSearchView(View):
         results_generator = client.results(search)
         return list(results_generator)
 
+    @staticmethod
+    def format_authors(authors):
+        return f"{authors[0].name}, et al." if len(authors) > 1 else authors[0].name
+
     async def create_embed(self):
-        embed = discord.Embed(title=f"arXiv Paper Results for '{self.query}'", description=f"Showing page {self.current_page}.", color=discord.Color.orange())
+        embed = self._embeds.get(self.current_page) or discord.Embed(title=f"arXiv Paper Results for '{self.query}'", description=f"Showing page {self.current_page}.", color=discord.Color.orange())
         if not self.search_done:
-            self.papers = await asyncio.to_thread(self._blocking_search_papers)
+            cache_key = self.query.lower().strip()
+            self.papers = _arxiv_cache.get(cache_key)
+            if self.papers is None:
+                self.papers = await asyncio.get_running_loop().run_in_executor(None, self._blocking_search_papers)
+                if self.papers: _arxiv_cache.put(cache_key, self.papers)
+            # Author strings never change for a result list, so format them once instead of on every page turn.
+            self._author_strs = [self.format_authors(paper.authors) for paper in self.papers]
             self.search_done = True
 
         start_index, end_index = (self.current_page - 1) * self.page_size, self.current_page * self.page_size
@@ -186,16 +458,19 @@ class PaperSearchView(View):
         if not current_page_papers:
             embed.description, self.select_menu.disabled, self.next_button.disabled = "No more results found.", True, True
             return embed
-            
-        def format_authors(authors):
-            names = [author.name for author in authors]
-            return f"{names[0]}, et al." if len(names) > 1 else names[0]
 
-        self.select_menu.options = [discord.SelectOption(label=f"{start_index + i + 1}. {paper.title[:80]}", description=f"by {format_authors(paper.authors)}", value=str(start_index + i)) for i, paper in enumerate(current_page_papers)]
+        options = self._options.get(self.current_page)
+        if options is None: options = self._options[self.current_page] = [discord.SelectOption(label=f"{start_index + i + 1}. {paper.title[:80]}", description=f"by {self._author_strs[start_index + i]}", value=str(start_index + i)) for i, paper in enumerate(current_page_papers)]
+        self.select_menu.options = options
         self.next_button.disabled = len(self.papers) <= end_index
+        self._embeds[self.current_page] = embed
         return embed
 
-    @discord.ui.select(placeholder="Choose a paper to get its PDF link...")
+    async def on_timeout(self):
+        self.papers, self._embeds, self._options, self._author_strs = [], {}, {}, []
+        await _disable_expired_view(self)
+
+    @discord.ui.select(placeholder="Choose a paper to get its PDF link...", custom_id="paper_select")
     async def select_menu(self, interaction: discord.Interaction, select: discord.ui.Select):
         if interaction.user != self.author: return await interaction.response.send_message("This is not your search menu!", ephemeral=True)
         await interaction.response.defer()
@@ -203,60 +478,54 @@ class PaperSearchView(View):
         safe_title = discord.utils.escape_markdown(paper.title)
         await interaction.followup.send(f"✅ Here is the PDF link for **{safe_title}**:\n{paper.pdf_url}")
 
-    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, disabled=True)
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, disabled=True, custom_id="paper_prev")
     async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user != self.author: return
+        await interaction.response.defer()
         if self.current_page > 1: self.current_page -= 1
         button.disabled = self.current_page == 1
-        await interaction.response.edit_message(embed=await self.create_embed(), view=self)
+        await interaction.edit_original_response(embed=await self.create_embed(), view=self)
 
-    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary, custom_id="paper_next")
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user != self.author: return
+        await interaction.response.defer()
         self.current_page += 1
         self.prev_button.disabled = False
-        await interaction.response.edit_message(embed=await self.create_embed(), view=self)
+        await interaction.edit_original_response(embed=await self.create_embed(), view=self)
 
 # --- BOT SETUP AND COMMANDS ---
-load_dotenv()
-TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN: raise ValueError("DISCORD_TOKEN not found in .env file!")
-
-class BookFinderBot(discord.Client):
-    def __init__(self, *, intents: discord.Intents):
-        super().__init__(intents=intents)
-        self.tree = app_commands.CommandTree(self)
-    async def setup_hook(self):
-        await self.tree.sync()
+# Everything with side effects (.env, token check, client, logging) lives under __main__: the parse pool's
+# spawned workers re-import this module, and they must not build a second bot.
+SYNC_STAMP_FILE = '.commands_synced'
 
-intents = discord.Intents.default()
-client = BookFinderBot(intents=intents)
+# The help text never changes, so the embed is built once and sent as-is on every /help.
+_HELP_EMBED = discord.Embed(title="Bot Help & Commands", color=discord.Color.from_rgb(70, 130, 180))
+_HELP_EMBED.add_field(name="/findbook `query` `[preferred_format]`", value="Searches the digital library for a book by title.", inline=False)
+_HELP_EMBED.add_field(name="/findpapers `query`", value="Searches arXiv.org for academic papers.", inline=False)
+_HELP_EMBED.set_footer(text="Bot made by Geetansh Jangid")
 
-@client.event
-async def on_ready():
-    print(f"--- Logged in as {client.user} ---")
-
-@client.tree.command(name="help", description="Shows information about the bot's commands.")
+@app_commands.command(name="help", description="Shows information about the bot's commands.")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 @app_commands.user_install()
 async def help_command(interaction: discord.Interaction):
-    embed = discord.Embed(title="Bot Help & Commands", color=discord.Color.from_rgb(70, 130, 180))
-    embed.add_field(name="/findbook `query` `[preferred_format]`", value="Searches the digital library for a book by title.", inline=False)
-    embed.add_field(name="/findpapers `query`", value="Searches arXiv.org for academic papers.", inline=False)
-    embed.set_footer(text="Bot made by Geetansh Jangid")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=_HELP_EMBED, ephemeral=True)
 
-@client.tree.command(name="findbook", description="Search for a book from the digital library.")
+@app_commands.command(name="findbook", description="Search for a book from the digital library.")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 @app_commands.user_install()
 async def findbook(interaction: discord.Interaction, query: str, preferred_format: str = None):
     await interaction.response.defer()
-    view = BookSearchView(query=query, preferred_format=preferred_format.lower().strip() if preferred_format else None, author=interaction.user)
-    embed = await view.create_embed()
-    if not view.books: await interaction.followup.send("Sorry, no results found for your book query.")
-    else: await interaction.followup.send(embed=embed, view=view)
+    try:
+        view = BookSearchView(query=query, preferred_format=preferred_format.lower().strip() if preferred_format else None, author=interaction.user, session=interaction.client.http_session)
+        embed = await view.create_embed()
+        if not view.books: await interaction.followup.send("Sorry, no results found for your book query.")
+        else: view.message = await interaction.followup.send(embed=embed, view=view)
+    except Exception as e:
+        logger.error("[COMMAND_ERROR] An error occurred during /findbook: %s", e)
+        await interaction.followup.send("An error occurred while trying to search for books.")
 
-@client.tree.command(name="findpapers", description="Search for an academic paper on arXiv.org.")
+@app_commands.command(name="findpapers", description="Search for an academic paper on arXiv.org.")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 @app_commands.user_install()
 async def findpapers(interaction: discord.Interaction, query: str):
@@ -265,27 +534,85 @@ async def findpapers(interaction: discord.Interaction, query: str):
         view = PaperSearchView(query=query, author=interaction.user)
         embed = await view.create_embed()
         if not view.papers: await interaction.followup.send("Sorry, no results found for your paper query on arXiv.")
-        else: await interaction.followup.send(embed=embed, view=view)
+        else: view.message = await interaction.followup.send(embed=embed, view=view)
     except Exception as e:
-        print(f"[COMMAND_ERROR] An error occurred during /findpapers: {e}")
+        logger.error("[COMMAND_ERROR] An error occurred during /findpapers: %s", e)
         await interaction.followup.send("An error occurred while trying to search for papers.")
 
-# --- FLASK WEB SERVER FOR HOSTING ---
-app = Flask(__name__)
-@app.route('/')
-def home():
-    return "The bot is running and ready to find books and papers!"
-
-def run_web_server():
-    port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
+class BookFinderBot(discord.Client):
+    def __init__(self, *, intents: discord.Intents):
+        # Views route on custom_id, not cached messages, so the message cache and guild chunking are pure overhead.
+        super().__init__(intents=intents, max_messages=None, chunk_guilds_at_startup=False)
+        self.tree = app_commands.CommandTree(self)
+        for command in (help_command, findbook, findpapers): self.tree.add_command(command)
+        self.http_session, self.reaper_task, self.web_runner = None, None, None
+    async def setup_hook(self):
+        # One session for the bot's lifetime so libgen connections are pooled and kept alive.
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=600, use_dns_cache=True, keepalive_timeout=30, enable_cleanup_closed=True)
+        self.http_session = aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=aiohttp.ClientTimeout(total=20))
+        create_fetch_semaphores()
+        create_rate_limiter()
+        start_parse_pool()
+        self.reaper_task = asyncio.create_task(cache_reaper())
+        self.web_runner = await start_web_server(self)
+        await self.sync_commands()
+    async def sync_commands(self):
+        """Pushes slash commands to Discord only when their definitions changed since the last sync."""
+        dev_guild_id = os.getenv('DEV_GUILD_ID')
+        if dev_guild_id:
+            # Guild-scoped sync is instant, so development restarts always sync there.
+            guild = discord.Object(id=int(dev_guild_id))
+            self.tree.copy_global_to(guild=guild)
+            await self.tree.sync(guild=guild)
+            return
+        payload = json.dumps([self.application_id, [command.to_dict(self.tree) for command in self.tree.get_commands()]], sort_keys=True)
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        try:
+            with open(SYNC_STAMP_FILE) as f:
+                if f.read().strip() == digest: return
+        except OSError: pass
+        await self.tree.sync()
+        # Hosts often run from a read-only directory; without the stamp the next start just syncs again.
+        try:
+            with open(SYNC_STAMP_FILE, 'w') as f: f.write(digest)
+        except OSError as e: logger.warning("[SYNC_WARNING] Could not write %s, commands will resync on next start: %s", SYNC_STAMP_FILE, e)
+    async def on_ready(self):
+        logger.info("--- Logged in as %s ---", self.user)
+    async def close(self):
+        if self.reaper_task: self.reaper_task.cancel()
+        if self.http_session: await self.http_session.close()
+        if PARSE_POOL: PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+        if self.web_runner: await self.web_runner.cleanup()
+        await super().close()
+
+# --- HEALTHCHECK WEB SERVER FOR HOSTING ---
+async def start_web_server(bot):
+    """Serves the healthcheck from the bot's own event loop instead of a separate thread."""
+    async def home(request):
+        # The server starts in setup_hook, before the gateway is connected, so report which phase we're in.
+        status = "Online" if bot.is_ready() else "Starting"
+        return web.Response(text=f"The bot is running and ready to find books and papers! Bot status: {status}")
+    app = web.Application()
+    app.router.add_get('/', home)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', int(os.environ.get('PORT', 8080))).start()
+    return runner
 
 # --- Run the bot and the web server ---
 if __name__ == "__main__":
+    configure_logging()
+    load_dotenv()
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    if not TOKEN: raise ValueError("DISCORD_TOKEN not found in .env file!")
+    try:
+        # uvloop is optional; fall back to the stock asyncio loop where it isn't installed (e.g. Windows).
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    client = BookFinderBot(intents=discord.Intents.default())
     try:
-        server_thread = Thread(target=run_web_server)
-        server_thread.daemon = True
-        server_thread.start()
         client.run(TOKEN)
     except Exception as e:
-        print(f"[BOT_ERROR] An unexpected error occurred while running the bot: {e}")
+        logger.error("[BOT_ERROR] An unexpected error occurred while running the bot: %s", e)
@@ -0,0 +1,110 @@
+# ==============================================================================
+#                 libgen results-page parsing for the Book Finder Bot
+# ==============================================================================
+# Importing this module has no side effects, so the parse pool's spawned worker
+# processes can load parse_books without starting any of the bot.
+# ==============================================================================
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urljoin
+
+from lxml import etree, html as lxml_html
+
+LIBGEN_BASE_URL = "https://libgen.li/index.php"
+
+_RESULTS_TABLE_RE = re.compile(rb'id=["\']?tablelibgen\b', re.I)
+_TABLE_TAG_RE = re.compile(rb'<table\b|</table\s*>', re.I)
+
+def results_table_slice(html):
+    """Cuts the tablelibgen table out of a results page so the rest of the page is never parsed or pickled."""
+    match = _RESULTS_TABLE_RE.search(html)
+    if not match: return html
+    start = max(html.rfind(b'<table', 0, match.start()), html.rfind(b'<TABLE', 0, match.start()))
+    if start == -1: return html
+    depth = 0
+    for tag in _TABLE_TAG_RE.finditer(html, start):
+        depth += -1 if tag.group().startswith(b'</') else 1
+        if depth == 0: return html[start:tag.end()]
+    return html[start:]
+
+# smart_strings=False returns plain str, which doesn't pin the tree and pickles back from the parse pool.
+_GETPHP_HREFS = etree.XPath(".//a[contains(@href, 'get.php')]/@href", smart_strings=False)
+_LINK_HREFS = etree.XPath('.//a/@href', smart_strings=False)
+_RESULT_ROWS = etree.XPath("//table[@id='tablelibgen']/tbody/tr")
+_TEXT_NODES = etree.XPath('.//text()', smart_strings=False)
+
+# Column positions in libgen.li's results table; a row must reach the mirrors column to be usable.
+TITLE_COL, AUTHOR_COL, SIZE_COL, EXTENSION_COL, MIRRORS_COL = 0, 1, 6, 7, 8
+
+@dataclass
+class Book:
+    """One libgen result row; final_link starts as the row's get.php link if it had one, else None until resolved."""
+    # Explicit __slots__ (dataclass(slots=True) needs 3.10) keep rows small and attribute reads fast.
+    __slots__ = ('title', 'author', 'size', 'extension', 'mirror_pages', 'final_link', 'summary')
+    title: str
+    author: str
+    size: str
+    extension: str
+    mirror_pages: list
+    final_link: Optional[str]
+    summary: str
+
+_parser_local = threading.local()
+
+def _results_parser():
+    """Returns this thread's reusable HTML parser; lxml parsers must not be used by two threads at once."""
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        # collect_ids=False skips building the id() lookup table, which the XPaths above never use.
+        # The table slice no longer carries the page's <meta charset>, so state libgen's UTF-8 explicitly.
+        parser = _parser_local.parser = lxml_html.HTMLParser(encoding='utf-8', collect_ids=False)
+    return parser
+
+_LIBGEN_ROOT = urljoin(LIBGEN_BASE_URL, '/')
+
+def _join(href):
+    """urljoin(LIBGEN_BASE_URL, href), with a concatenation fast path for the plain hrefs libgen's table uses."""
+    # The fast path only takes hrefs urljoin leaves untouched apart from the prefix: printable (urlsplit strips
+    # whitespace and controls), no params, fragment or empty trailing query, and if relative, no scheme, no leading
+    # space, '.' or '?', no empty segments and no dot segments.
+    if href.isprintable() and not href.endswith('?') and ';' not in href and '#' not in href:
+        if href.startswith(('http://', 'https://')): return href
+        if href[:1] not in ' .?' and ':' not in href and '//' not in href and '/.' not in href: return _LIBGEN_ROOT + href.lstrip('/')
+    return urljoin(LIBGEN_BASE_URL, href)
+
+def _text(node, separator=''):
+    """Equivalent of BeautifulSoup's get_text(separator, strip=True) for an lxml element."""
+    return separator.join(filter(None, map(str.strip, _TEXT_NODES(node))))
+
+def parse_books(html, preferred_format):
+    """Parses a libgen results page into Books; CPU-bound, so callers run it off the event loop."""
+    if not html.strip(): return []
+    tree = lxml_html.fromstring(html, parser=_results_parser())
+    books_found = []
+    # Globals and attribute lookups bound once; this loop runs for every row of every page.
+    text, join, get_hrefs, link_hrefs, append = _text, _join, _GETPHP_HREFS, _LINK_HREFS, books_found.append
+    
+    for row in _RESULT_ROWS(tree):
+        cells = row.findall('td')
+        if len(cells) > MIRRORS_COL:
+            title_cell, mirrors_cell = cells[TITLE_COL], cells[MIRRORS_COL]
+            title_text = "N/A"
+            title_b_tag = title_cell.find('.//b')
+            if title_b_tag is not None: title_text = text(title_b_tag, ' ')
+            else:
+                title_a_tag = title_cell.find('.//a')
+                if title_a_tag is not None: title_text = text(title_a_tag)
+
+            get_links = get_hrefs(mirrors_cell)
+            final_link_url = join(get_links[0]) if get_links else None
+            mirror_pages = [] if final_link_url else [join(href) for href in link_hrefs(mirrors_cell) if href]
+            
+            author, size, extension = text(cells[AUTHOR_COL]), text(cells[SIZE_COL]), text(cells[EXTENSION_COL]).lower()
+            # The summary is the select-menu description, built once here rather than on every page render.
+            append(Book(title_text, author, size, extension, mirror_pages, final_link_url, f"{author[:50]} [{extension}, {size}]"))
+    
+    if preferred_format: books_found.sort(key=lambda book: book.extension == preferred_format, reverse=True)
+    return books_found